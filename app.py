@@ -1,12 +1,6 @@
 import streamlit as st
 import os
 from dotenv import load_dotenv
-from salesforce_agent import SalesforceAgent
-from prioritization_simple import LeadPrioritizer, OpportunityScorer, FollowUpGenerator
-from conversational_agent import ConversationalSalesAgent
-import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
 import time
 
 load_dotenv()
@@ -70,12 +64,20 @@ with st.sidebar:
     st.markdown("---")
     st.header("⚙️ Configuration")
     
-    limit = st.slider("📊 Records to Analyze", 5, 50, 20, help="Number of leads and opportunities to fetch")
+    limit = st.select_slider("📊 Records to Analyze", options=[5, 10, 20, 50, 100, 500, 1000, 5000, 10000, 25000, 50000],
+                             value=20, help="Number of leads and opportunities to fetch")
+    score_budget = st.slider("⏱️ Scoring Budget (seconds)", 0, 120, 0,
+                             help="0 waits for every GPT-4 score; otherwise unfinished records get a provisional heuristic score")
+    render_mode = st.radio("🖥️ Rendering", ["Auto", "Standard", "Large data"], horizontal=True,
+                           help="Large data bins charts server-side, uses WebGL and pages tables")
     
     st.markdown("---")
     
     if st.button("🚀 Run AI Analysis", type="primary", use_container_width=True):
         st.session_state.run_analysis = True
+        # An explicit run always refetches; other reruns reuse the cached results
+        st.session_state.pop('fetched', None)
+        st.session_state.pop('scored', None)
     
     st.markdown("---")
     st.markdown("### 📋 Features")
@@ -89,17 +91,98 @@ with st.sidebar:
 
 # Main content
 if 'run_analysis' in st.session_state and st.session_state.run_analysis:
+    # Imported here rather than at the top so the landing page stays light;
+    # the chat stack (langchain/langgraph) is only loaded once the chat is used.
+    from salesforce_agent import SalesforceAgent
+    from prioritization_simple import LeadPrioritizer, OpportunityScorer, FollowUpGenerator
+    from record_store import RecordStore, LEAD_COLUMNS, OPPORTUNITY_COLUMNS
+    from score_writeback import ScoreWriteBack, LEAD_FIELDS, OPPORTUNITY_FIELDS
+    from task_graph import TaskGraph
+    from charts import (LARGE_DATA_THRESHOLD, style_scores, page, page_count,
+                        score_histogram, opportunity_scatter)
+    import plotly.graph_objects as go
+    import plotly.express as px
+    import numpy as np
     
-    with st.spinner("Connecting to Salesforce..."):
-        agent = SalesforceAgent(
-            sf_username=os.getenv("SF_USERNAME"),
-            sf_password=os.getenv("SF_PASSWORD"),
-            sf_token=os.getenv("SF_TOKEN"),
-            limit=limit
-        )
+    # Login, fetch and scoring are kept in session state so widget reruns (paging,
+    # tabs, buttons) only re-render. They are redone when the record limit or the
+    # scoring budget changes, on Run AI Analysis, or on Refresh Scores.
+    if st.session_state.get('sf_agent_limit') != limit:
+        with st.spinner("Connecting to Salesforce..."):
+            st.session_state.sf_agent = SalesforceAgent(
+                sf_username=os.getenv("SF_USERNAME"),
+                sf_password=os.getenv("SF_PASSWORD"),
+                sf_token=os.getenv("SF_TOKEN"),
+                limit=limit
+            )
+            st.session_state.sf_agent_limit = limit
+    agent = st.session_state.sf_agent
+    
+    # Kept across reruns so scores still running in the background are swapped in next time
+    if 'prioritizer' not in st.session_state:
+        st.session_state.prioritizer = LeadPrioritizer()
+        st.session_state.scorer = OpportunityScorer()
+    prioritizer = st.session_state.prioritizer
+    scorer = st.session_state.scorer
+    budget = score_budget or None
+    
+    def visible_ids(store, score_column, page_key):
+        """Ids of the top-10 table and the current page of the full table."""
+        ranked = store.top_n(score_column).df
+        shown = page(ranked, st.session_state.get(page_key, 1))
+        return set(ranked['Id'][:10]) | set(shown['Id'])
+    
+    fetched = st.session_state.get('fetched')
+    if fetched is None or fetched['limit'] != limit:
+        fetched = None
+        # query results are lru-cached on the agent; a refetch must reach Salesforce
+        SalesforceAgent.get_leads.cache_clear()
+        SalesforceAgent.get_opportunities.cache_clear()
+        # and finished GPT-4 scores are only reused until the data is refetched
+        prioritizer.scheduler.clear()
+        scorer.scheduler.clear()
+    scored = st.session_state.get('scored')
+    rescore = st.session_state.pop('rescore', False)
+    if fetched is None or scored is None or scored['budget'] != budget or rescore:
+        # Rows on screen in the previous result get their GPT-4 score first
+        lead_priority = visible_ids(scored['leads'], 'priority_score', 'lead_page') if scored else ()
+        opp_priority = visible_ids(scored['opportunities'], 'conversion_score', 'opp_page') if scored else ()
+        # Leads and opportunities are fetched and scored as two concurrent branches
+        with st.spinner("Fetching and AI scoring leads and opportunities..."):
+            graph = TaskGraph()
+            if fetched is None:
+                graph.add('leads', lambda: RecordStore.from_records(agent.get_leads(), LEAD_COLUMNS))
+                graph.add('opportunities', lambda: RecordStore.from_records(agent.get_opportunities(), OPPORTUNITY_COLUMNS))
+            else:
+                graph.add('leads', lambda: fetched['leads'])
+                graph.add('opportunities', lambda: fetched['opportunities'])
+            graph.add('scored_leads', lambda leads: prioritizer.prioritize_leads(
+                leads, budget=budget, priority_ids=lead_priority), 'leads')
+            graph.add('scored_opps', lambda opps: scorer.score_opportunities(
+                opps, budget=budget, priority_ids=opp_priority), 'opportunities')
+            results = graph.run()
         
-        leads = agent.get_leads()
-        opportunities = agent.get_opportunities()
+        fetched = {'limit': limit, 'leads': results['leads'], 'opportunities': results['opportunities']}
+        scored = {'budget': budget, 'leads': results['scored_leads'], 'opportunities': results['scored_opps']}
+        st.session_state.fetched = fetched
+        st.session_state.scored = scored
+    
+    leads, opportunities = fetched['leads'], fetched['opportunities']
+    scored_leads, scored_opps = scored['leads'], scored['opportunities']
+    
+    provisional = 0
+    for store in (scored_leads, scored_opps):
+        if 'score_provisional' in store.df.columns:
+            provisional += len(store.where('score_provisional', '==', True))
+    if provisional:
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.warning(f"⏳ {provisional} scores are provisional estimates; GPT-4 scores are still being computed")
+        with col2:
+            if st.button("🔄 Refresh Scores"):
+                # Re-score the cached records; finished GPT-4 scores replace the estimates
+                st.session_state.rescore = True
+                st.rerun()
     
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -109,16 +192,34 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
     with col3:
         st.info(f"💰 {len(opportunities)} Opportunities Retrieved")
     
+    large_data = render_mode == "Large data" or (
+        render_mode == "Auto" and max(len(leads), len(opportunities)) > LARGE_DATA_THRESHOLD
+    )
+    
+    def show_paged_table(df, key):
+        pages = page_count(df)
+        number = st.number_input(f"Page (of {pages})", 1, pages, 1, key=key) if pages > 1 else 1
+        st.dataframe(style_scores(page(df, number)), use_container_width=True, hide_index=True)
+    
+    def show_writeback_report(report):
+        st.success(f"✅ {report['written']} written, {report['unchanged']} unchanged")
+        if report['provisional'] or report['unscored']:
+            st.info(f"⏳ {report['provisional']} provisional and {report['unscored']} unscored records were not written")
+        if report['failed']:
+            st.error(f"❌ {len(report['failed'])} records failed")
+            st.json(report['failed'][:20])
+    
     # Create tabs
-    tab1, tab2, tab3, tab4 = st.tabs(["📊 Leads", "💰 Opportunities", "📈 Dashboard", "💬 AI Chat"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Leads", "💰 Opportunities", "📈 Dashboard", "💬 AI Chat", "🔎 Lookalikes"])
     
     # TAB 1: LEADS
     with tab1:
         st.header("Lead Prioritization")
         
-        with st.spinner("AI scoring leads..."):
-            prioritizer = LeadPrioritizer()
-            scored_leads = prioritizer.prioritize_leads(leads)
+        if prioritizer.last_dedupe:
+            stats = prioritizer.last_dedupe
+            st.caption(f"🧬 {stats['records']} leads scored as {stats['clusters']} unique profiles "
+                       f"({stats['duplicates']} duplicate GPT-4 calls saved)")
         
         col1, col2 = st.columns([2, 1])
         
@@ -126,25 +227,18 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
             st.subheader("🏆 Top Leads")
             
             # Create dataframe
-            df_leads = pd.DataFrame(scored_leads[:10])
+            df_leads = scored_leads.top_n('priority_score', 10).df
             df_display = df_leads[['Name', 'Company', 'Status', 'priority_score']].copy()
             df_display.columns = ['Name', 'Company', 'Status', 'Score']
+            st.dataframe(style_scores(df_display), use_container_width=True, hide_index=True)
             
-            # Add color coding
-            def color_score(val):
-                if val >= 80:
-                    return 'background-color: #d4edda'
-                elif val >= 60:
-                    return 'background-color: #fff3cd'
-                else:
-                    return 'background-color: #f8d7da'
-            
-            styled_df = df_display.style.applymap(color_score, subset=['Score'])
-            st.dataframe(styled_df, use_container_width=True, hide_index=True)
+            with st.expander(f"📋 All {len(scored_leads)} Leads"):
+                df_all = scored_leads.top_n('priority_score').df[['Name', 'Company', 'Status', 'priority_score']]
+                show_paged_table(df_all.rename(columns={'priority_score': 'Score'}), key="lead_page")
             
             # Gradient bar chart
-            colors = ['#667eea' if score >= 70 else '#ffa500' if score >= 50 else '#ff6b6b' 
-                     for score in df_leads['priority_score'][:10]]
+            lead_scores = df_leads['priority_score'].to_numpy()
+            colors = np.select([lead_scores >= 70, lead_scores >= 50], ['#667eea', '#ffa500'], '#ff6b6b')
             
             fig_leads = go.Figure(data=[
                 go.Bar(
@@ -171,15 +265,15 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
         with col2:
             st.subheader("⭐ Top Lead Details")
             
-            if scored_leads:
-                top_lead = scored_leads[0]
+            if len(scored_leads):
+                top_lead = scored_leads.top_n('priority_score', 1).to_records()[0]
                 
                 st.markdown(f"""
                 <div class="lead-card">
                     <h3>👤 {top_lead['Name']}</h3>
                     <p><b>🏢 Company:</b> {top_lead['Company']}</p>
-                    <p><b>📊 Status:</b> {top_lead.get('Status', 'N/A')}</p>
-                    <p><b>📧 Email:</b> {top_lead.get('Email', 'N/A')}</p>
+                    <p><b>📊 Status:</b> {top_lead.get('Status') or 'N/A'}</p>
+                    <p><b>📧 Email:</b> {top_lead.get('Email') or 'N/A'}</p>
                 </div>
                 """, unsafe_allow_html=True)
                 
@@ -192,58 +286,35 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
                         followup = generator.generate_actions(top_lead, "lead")
                         st.markdown("### 📝 Follow-Up Actions")
                         st.write(followup)
+                
+                if st.button("💾 Save Scores to Salesforce", key="lead_writeback"):
+                    with st.spinner("Writing scores..."):
+                        report = ScoreWriteBack(agent.sf, LEAD_FIELDS).write(scored_leads.to_records(
+                            columns=['Id', 'priority_score', 'score_reason', 'score_provisional']))
+                    show_writeback_report(report)
     
     # TAB 2: OPPORTUNITIES
     with tab2:
         st.header("Opportunity Scoring")
         
-        with st.spinner("AI scoring opportunities..."):
-            scorer = OpportunityScorer()
-            scored_opps = scorer.score_opportunities(opportunities)
-        
         col1, col2 = st.columns([2, 1])
         
         with col1:
             st.subheader("💎 Top Opportunities")
             
             # Create dataframe
-            df_opps = pd.DataFrame(scored_opps[:10])
+            df_opps = scored_opps.top_n('conversion_score', 10).df
             df_display = df_opps[['Name', 'Amount', 'StageName', 'conversion_score']].copy()
-            df_display['Amount'] = df_display['Amount'].apply(lambda x: f"${x:,.0f}")
+            df_display['Amount'] = '$' + df_display['Amount'].fillna(0).map('{:,.0f}'.format)
             df_display.columns = ['Name', 'Amount', 'Stage', 'Score']
+            st.dataframe(style_scores(df_display), use_container_width=True, hide_index=True)
             
-            # Add color coding
-            def color_score(val):
-                if isinstance(val, (int, float)):
-                    if val >= 80:
-                        return 'background-color: #d4edda'
-                    elif val >= 60:
-                        return 'background-color: #fff3cd'
-                    else:
-                        return 'background-color: #f8d7da'
-                return ''
+            with st.expander(f"📋 All {len(scored_opps)} Opportunities"):
+                df_all = scored_opps.top_n('conversion_score').df[['Name', 'Amount', 'StageName', 'conversion_score']]
+                show_paged_table(df_all.rename(columns={'StageName': 'Stage', 'conversion_score': 'Score'}), key="opp_page")
             
-            styled_df = df_display.style.applymap(color_score, subset=['Score'])
-            st.dataframe(styled_df, use_container_width=True, hide_index=True)
-            
-            # Bubble chart
-            fig_opps = go.Figure(data=[
-                go.Scatter(
-                    x=df_opps['Amount'][:10],
-                    y=df_opps['conversion_score'][:10],
-                    mode='markers',
-                    marker=dict(
-                        size=df_opps['conversion_score'][:10]/3,
-                        color=df_opps['conversion_score'][:10],
-                        colorscale='Viridis',
-                        showscale=True,
-                        colorbar=dict(title="Score"),
-                        line=dict(width=2, color='white')
-                    ),
-                    text=df_opps['Name'][:10],
-                    hovertemplate='<b>%{text}</b><br>Amount: $%{x:,.0f}<br>Score: %{y}<extra></extra>'
-                )
-            ])
+            # Bubble chart (top 10, or every opportunity via WebGL in large-data mode)
+            fig_opps = opportunity_scatter(scored_opps.df if large_data else df_opps, large=large_data)
             fig_opps.update_layout(
                 title="<b>Opportunity Value vs Conversion Score</b>",
                 xaxis_title="Amount ($)",
@@ -257,15 +328,15 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
         with col2:
             st.subheader("💰 Top Opportunity Details")
             
-            if scored_opps:
-                top_opp = scored_opps[0]
+            if len(scored_opps):
+                top_opp = scored_opps.top_n('conversion_score', 1).to_records()[0]
                 
                 st.markdown(f"""
                 <div class="opp-card">
                     <h3>💼 {top_opp['Name']}</h3>
-                    <p><b>💵 Amount:</b> ${top_opp['Amount']:,.0f}</p>
-                    <p><b>📈 Stage:</b> {top_opp.get('StageName', 'N/A')}</p>
-                    <p><b>📅 Close Date:</b> {top_opp.get('CloseDate', 'N/A')}</p>
+                    <p><b>💵 Amount:</b> ${top_opp['Amount'] or 0:,.0f}</p>
+                    <p><b>📈 Stage:</b> {top_opp.get('StageName') or 'N/A'}</p>
+                    <p><b>📅 Close Date:</b> {top_opp.get('CloseDate') or 'N/A'}</p>
                 </div>
                 """, unsafe_allow_html=True)
                 
@@ -278,6 +349,12 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
                         followup = generator.generate_actions(top_opp, "opportunity")
                         st.markdown("### 📝 Follow-Up Actions")
                         st.write(followup)
+                
+                if st.button("💾 Save Scores to Salesforce", key="opp_writeback"):
+                    with st.spinner("Writing scores..."):
+                        report = ScoreWriteBack(agent.sf, OPPORTUNITY_FIELDS).write(scored_opps.to_records(
+                            columns=['Id', 'conversion_score', 'score_reason', 'score_provisional']))
+                    show_writeback_report(report)
     
     # TAB 3: DASHBOARD
     with tab3:
@@ -294,7 +371,7 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
             """.format(len(scored_leads)), unsafe_allow_html=True)
         
         with col2:
-            avg_lead_score = sum(l['priority_score'] for l in scored_leads) / len(scored_leads)
+            avg_lead_score = scored_leads.summary('priority_score')['mean']
             st.markdown("""
             <div style="background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%); padding: 1.5rem; border-radius: 10px; color: white; text-align: center;">
                 <h2 style="margin: 0; font-size: 2.5rem;">{:.1f}</h2>
@@ -311,7 +388,7 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
             """.format(len(scored_opps)), unsafe_allow_html=True)
         
         with col4:
-            total_value = sum(o['Amount'] for o in scored_opps if o['Amount'])
+            total_value = scored_opps.summary('Amount')['sum']
             st.markdown("""
             <div style="background: linear-gradient(135deg, #43e97b 0%, #38f9d7 100%); padding: 1.5rem; border-radius: 10px; color: white; text-align: center;">
                 <h2 style="margin: 0; font-size: 2.5rem;">${:,.0f}</h2>
@@ -325,17 +402,7 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
         
         with col1:
             # Lead score distribution with gradient
-            fig_dist = go.Figure(data=[
-                go.Histogram(
-                    x=[l['priority_score'] for l in scored_leads],
-                    nbinsx=10,
-                    marker=dict(
-                        color=[l['priority_score'] for l in scored_leads],
-                        colorscale='Viridis',
-                        showscale=False
-                    )
-                )
-            ])
+            fig_dist = score_histogram(scored_leads, 'priority_score')
             fig_dist.update_layout(
                 title="<b>Lead Score Distribution</b>",
                 xaxis_title="Score Range",
@@ -348,15 +415,12 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
         
         with col2:
             # Opportunity stage breakdown with custom colors
-            stage_counts = {}
-            for opp in scored_opps:
-                stage = opp.get('StageName', 'Unknown')
-                stage_counts[stage] = stage_counts.get(stage, 0) + 1
+            stage_counts = scored_opps.group_count('StageName')
             
             fig_pie = go.Figure(data=[
                 go.Pie(
-                    labels=list(stage_counts.keys()),
-                    values=list(stage_counts.values()),
+                    labels=stage_counts.index,
+                    values=stage_counts.values,
                     hole=0.4,
                     marker=dict(
                         colors=['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe', '#00f2fe'],
@@ -379,14 +443,17 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
         st.header("🤖 Conversational AI Assistant")
         st.markdown("Ask questions about your leads and opportunities in natural language!")
         
-        # Initialize chat agent
-        if 'chat_agent' not in st.session_state:
-            with st.spinner("Initializing AI assistant..."):
-                st.session_state.chat_agent = ConversationalSalesAgent(
-                    sf_username=os.getenv("SF_USERNAME"),
-                    sf_password=os.getenv("SF_PASSWORD"),
-                    sf_token=os.getenv("SF_TOKEN")
-                )
+        # Chat agent is created on the first message and cached in session state
+        def get_chat_agent():
+            if 'chat_agent' not in st.session_state:
+                with st.spinner("Initializing AI assistant..."):
+                    from conversational_agent import ConversationalSalesAgent
+                    st.session_state.chat_agent = ConversationalSalesAgent(
+                        sf_username=os.getenv("SF_USERNAME"),
+                        sf_password=os.getenv("SF_PASSWORD"),
+                        sf_token=os.getenv("SF_TOKEN")
+                    )
+            return st.session_state.chat_agent
         
         # Initialize chat history
         if 'chat_history' not in st.session_state:
@@ -431,7 +498,7 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
             # Get AI response
             with st.spinner("🤔 Thinking..."):
                 try:
-                    response = st.session_state.chat_agent.chat(user_input)
+                    response = get_chat_agent().chat(user_input)
                     st.session_state.chat_history.append({"role": "assistant", "content": response})
                 except Exception as e:
                     st.session_state.chat_history.append({"role": "assistant", "content": f"Error: {str(e)}"})
@@ -441,6 +508,43 @@ if 'run_analysis' in st.session_state and st.session_state.run_analysis:
             with st.chat_message(message["role"]):
                 st.write(message["content"])
 
+    # TAB 5: LOOKALIKES
+    with tab5:
+        st.header("🔎 Lookalike Search")
+        st.markdown("Embedding-based similarity over your leads and opportunities.")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("🎯 Leads Like Recent Conversions")
+            n_lookalikes = st.number_input("Number of leads", 1, 50, 5, key="lookalike_n")
+            if st.button("Find Lookalike Leads"):
+                with st.spinner("Searching..."):
+                    matches = agent.lookalike_leads(n_lookalikes)
+                if matches:
+                    st.dataframe(
+                        [{'Name': lead['Name'], 'Company': lead['Company'], 'Status': lead.get('Status'),
+                          'Similarity': round(similarity, 3)} for lead, similarity in matches],
+                        use_container_width=True, hide_index=True
+                    )
+                else:
+                    st.info("No converted leads to compare against")
+        
+        with col2:
+            st.subheader("💼 Similar Deals")
+            # Selected by Id: names are often repeated across an org's opportunities
+            opp_labels = {opp['Id']: f"{opp['Name']} (${opp['Amount'] or 0:,.0f})"
+                          for opp in opportunities.to_records(columns=['Id', 'Name', 'Amount'])}
+            selected_opp = st.selectbox("Opportunity", list(opp_labels), format_func=opp_labels.get, key="similar_opp")
+            if selected_opp and st.button("Find Similar Deals"):
+                with st.spinner("Searching..."):
+                    target, matches = agent.similar_opportunities(opportunity_id=selected_opp, n=5)
+                st.dataframe(
+                    [{'Name': opp['Name'], 'Amount': f"${opp['Amount'] or 0:,.0f}", 'Stage': opp.get('StageName'),
+                      'Similarity': round(similarity, 3)} for opp, similarity in matches],
+                    use_container_width=True, hide_index=True
+                )
+
 else:
     # Hero section
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -0,0 +1,94 @@
+"""Cold-start checks for the app's entry points.
+
+Each case runs in a fresh interpreter, times it, and lists modules it was not
+supposed to load. Exits non-zero on a regression, including a case that fails
+to run at all, so it can run in CI:
+
+    python bench_startup.py
+    python bench_startup.py --importtime   # also show the slowest imports
+"""
+import subprocess
+import sys
+import json
+import os
+
+CHAT_STACK = ['langchain', 'langchain_core', 'langchain_openai', 'langgraph']
+
+# name: (code to run, modules that must stay unloaded, time budget in seconds)
+CASES = {
+    'landing page': (
+        "from streamlit.testing.v1 import AppTest\n"
+        "at = AppTest.from_file('app.py', default_timeout=30).run()\n"
+        "assert not at.exception, [e.message for e in at.exception]",
+        # streamlit imports plotly itself, so only our own heavy modules are checked
+        CHAT_STACK + ['openai', 'simple_salesforce', 'record_store'],
+        10.0,
+    ),
+    'import conversational_agent': (
+        "import conversational_agent",
+        CHAT_STACK + ['openai', 'simple_salesforce'],
+        3.0,
+    ),
+    'construct ConversationalSalesAgent': (
+        "from conversational_agent import ConversationalSalesAgent\n"
+        "ConversationalSalesAgent('user', 'password', 'token')",
+        CHAT_STACK + ['openai', 'simple_salesforce'],
+        3.0,
+    ),
+}
+
+_RUNNER = """
+import sys, time, json
+start = time.perf_counter()
+exec({code!r})
+elapsed = time.perf_counter() - start
+loaded = sorted(m for m in {forbidden!r} if m in sys.modules)
+print(json.dumps({{'elapsed': elapsed, 'loaded': loaded}}))
+"""
+
+
+def run_case(code, forbidden, importtime=False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', _RUNNER.format(code=code, forbidden=forbidden)]
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed')
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def slowest_imports(stderr, n=10):
+    """Top-n (cumulative_us, module) pairs from `-X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main(argv):
+    importtime = '--importtime' in argv
+    failed = False
+    for name, (code, forbidden, budget) in CASES.items():
+        try:
+            result, stderr = run_case(code, forbidden, importtime)
+        except RuntimeError as e:
+            print(f"FAIL  {name}: {e}")
+            failed = True
+            continue
+        ok = result['elapsed'] <= budget and not result['loaded']
+        failed = failed or not ok
+        print(f"{'OK  ' if ok else 'FAIL'}  {name}: {result['elapsed']:.2f}s (budget {budget:.1f}s)")
+        if result['loaded']:
+            print(f"      eagerly loaded: {', '.join(result['loaded'])}")
+        if importtime:
+            for cumulative, module in slowest_imports(stderr):
+                print(f"      {cumulative / 1e6:6.3f}s  {module}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
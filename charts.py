@@ -0,0 +1,82 @@
+import plotly.graph_objects as go
+import pandas as pd
+import numpy as np
+
+# Above this many records the dashboard switches to the large-data rendering
+# path: WebGL scatter with downsampling and paged tables.
+LARGE_DATA_THRESHOLD = 1000
+MAX_SCATTER_POINTS = 5000
+TABLE_PAGE_SIZE = 100
+
+_SCORE_CSS = ['background-color: #d4edda', 'background-color: #fff3cd', 'background-color: #f8d7da']
+
+
+def score_css(scores):
+    """Background colour per score (green >= 80, yellow >= 60, red below), '' for missing."""
+    scores = pd.to_numeric(pd.Series(scores), errors='coerce').to_numpy(dtype=float)
+    return np.select([scores >= 80, scores >= 60, scores < 60], _SCORE_CSS, '')
+
+
+def style_scores(df, column='Score'):
+    """Styler colouring `column` with one vectorized call instead of per-cell applymap."""
+    return df.style.apply(lambda col: score_css(col), subset=[column])
+
+
+def page(df, number, size=TABLE_PAGE_SIZE):
+    """Rows for 1-based page `number`."""
+    start = (number - 1) * size
+    return df.iloc[start:start + size]
+
+
+def page_count(df, size=TABLE_PAGE_SIZE):
+    return max(1, -(-len(df) // size))
+
+
+def downsample(df, max_points, priority_column):
+    """At most `max_points` rows: the top half by `priority_column` plus a fixed random sample of the rest."""
+    if len(df) <= max_points:
+        return df
+    top = df.nlargest(max_points // 2, priority_column)
+    rest = df.drop(top.index).sample(max_points - len(top), random_state=0)
+    return pd.concat([top, rest])
+
+
+def score_histogram(store, column, bins=10):
+    """Histogram binned server-side, so only `bins` bars are sent to the browser."""
+    counts, edges = store.histogram(column, bins=bins, range=(0, 100))
+    centers = (edges[:-1] + edges[1:]) / 2
+    return go.Figure(data=[
+        go.Bar(
+            x=centers,
+            y=counts,
+            width=edges[1] - edges[0],
+            marker=dict(color=centers, colorscale='Viridis', showscale=False),
+            customdata=np.column_stack([edges[:-1], edges[1:]]),
+            hovertemplate='Score %{customdata[0]:.0f}-%{customdata[1]:.0f}<br>Count: %{y}<extra></extra>'
+        )
+    ])
+
+
+def opportunity_scatter(df, large=False):
+    """Amount vs conversion score bubbles; WebGL and downsampled when `large`."""
+    if large:
+        df = downsample(df, MAX_SCATTER_POINTS, 'conversion_score')
+    trace = go.Scattergl if large else go.Scatter
+    scores = df['conversion_score'].astype(float)
+    return go.Figure(data=[
+        trace(
+            x=df['Amount'],
+            y=scores,
+            mode='markers',
+            marker=dict(
+                size=(scores / 3) if not large else (scores / 10 + 3),
+                color=scores,
+                colorscale='Viridis',
+                showscale=True,
+                colorbar=dict(title="Score"),
+                line=dict(width=2 if not large else 0, color='white')
+            ),
+            text=df['Name'],
+            hovertemplate='<b>%{text}</b><br>Amount: $%{x:,.0f}<br>Score: %{y}<extra></extra>'
+        )
+    ])
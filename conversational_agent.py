@@ -1,84 +1,136 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.tools import tool
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langgraph.prebuilt import create_react_agent
-from salesforce_agent import SalesforceAgent
-from prioritization_simple import LeadPrioritizer, OpportunityScorer, FollowUpGenerator
+from functools import cached_property
+from record_store import RecordStore, LEAD_COLUMNS, OPPORTUNITY_COLUMNS
+from task_graph import TaskGraph
 import os
 import json
 
+# langchain/langgraph, the Salesforce login and the scorers are all loaded on
+# first use, so constructing the agent is free until someone actually chats.
+
+def _provisional(record):
+    return " (provisional)" if record.get('score_provisional') else ""
+
 class ConversationalSalesAgent:
     def __init__(self, sf_username, sf_password, sf_token):
-        self.sf_agent = SalesforceAgent(sf_username, sf_password, sf_token, limit=50)
-        self.prioritizer = LeadPrioritizer()
-        self.scorer = OpportunityScorer()
-        self.followup_gen = FollowUpGenerator()
-        self.llm = ChatOpenAI(model="gpt-4", temperature=0)
-        
+        self._credentials = (sf_username, sf_password, sf_token)
+        # Seconds a tool waits for GPT-4 scores before using provisional ones
+        self.score_budget = float(os.getenv("SCORING_BUDGET_SECONDS", "0")) or None
+    
+    @cached_property
+    def sf_agent(self):
+        from salesforce_agent import SalesforceAgent
+        return SalesforceAgent(*self._credentials, limit=50)
+    
+    @cached_property
+    def prioritizer(self):
+        from prioritization_simple import LeadPrioritizer
+        return LeadPrioritizer()
+    
+    @cached_property
+    def scorer(self):
+        from prioritization_simple import OpportunityScorer
+        return OpportunityScorer()
+    
+    @cached_property
+    def followup_gen(self):
+        from prioritization_simple import FollowUpGenerator
+        return FollowUpGenerator()
+    
+    @cached_property
+    def llm(self):
+        from langchain_openai import ChatOpenAI
+        from transport import openai_http_client
+        return ChatOpenAI(model="gpt-4", temperature=0, http_client=openai_http_client())
+    
+    @cached_property
+    def agent(self):
         # Create agent with tools
-        self.agent = self._create_agent()
+        return self._create_agent()
+    
+    def _leads(self):
+        return RecordStore.from_records(self.sf_agent.get_leads(), LEAD_COLUMNS)
+    
+    def _opportunities(self):
+        return RecordStore.from_records(self.sf_agent.get_opportunities(), OPPORTUNITY_COLUMNS)
+    
+    def _score_leads(self, leads):
+        return self.prioritizer.prioritize_leads(leads, budget=self.score_budget)
+    
+    def _score_opportunities(self, opps):
+        return self.scorer.score_opportunities(opps, budget=self.score_budget)
+    
+    def _scored_leads(self):
+        return self._score_leads(self._leads())
+    
+    def _scored_opportunities(self):
+        return self._score_opportunities(self._opportunities())
+    
+    def _scored_pipeline(self):
+        """Fetch and score leads and opportunities as two concurrent branches."""
+        # Both fetch branches use sf_agent; create it here (login once) rather than
+        # letting the two worker threads race on the cached_property
+        self.sf_agent
+        graph = TaskGraph()
+        graph.add('leads', self._leads)
+        graph.add('opportunities', self._opportunities)
+        graph.add('scored_leads', self._score_leads, 'leads')
+        graph.add('scored_opps', self._score_opportunities, 'opportunities')
+        results = graph.run()
+        return results['scored_leads'], results['scored_opps']
     
     def _create_agent(self):
+        from langchain_core.tools import tool
+        from langgraph.prebuilt import create_react_agent
+        
         @tool
         def get_top_leads(n: int = 5) -> str:
             """Get top N prioritized leads with their scores. Use this when user asks about best leads or top leads."""
-            leads = self.sf_agent.get_leads()
-            scored = self.prioritizer.prioritize_leads(leads)[:n]
+            scored = self._scored_leads().top_n('priority_score', n)
             
             result = f"Top {n} Leads:\n"
             for i, lead in enumerate(scored, 1):
-                result += f"{i}. {lead['Name']} ({lead['Company']}) - Score: {lead['priority_score']}\n"
+                result += f"{i}. {lead['Name']} ({lead['Company']}) - Score: {lead['priority_score']}{_provisional(lead)}\n"
             return result
         
         @tool
         def get_top_opportunities(n: int = 5) -> str:
             """Get top N opportunities with conversion scores. Use this when user asks about best opportunities or deals."""
-            opps = self.sf_agent.get_opportunities()
-            scored = self.scorer.score_opportunities(opps)[:n]
+            scored = self._scored_opportunities().top_n('conversion_score', n)
             
             result = f"Top {n} Opportunities:\n"
             for i, opp in enumerate(scored, 1):
-                result += f"{i}. {opp['Name']} - ${opp['Amount']:,.0f} - Score: {opp['conversion_score']}\n"
+                result += f"{i}. {opp['Name']} - ${opp['Amount'] or 0:,.0f} - Score: {opp['conversion_score']}{_provisional(opp)}\n"
             return result
         
         @tool
         def search_lead_by_name(name: str) -> str:
             """Search for a specific lead by name and get their details and score."""
-            leads = self.sf_agent.get_leads()
-            scored = self.prioritizer.prioritize_leads(leads)
+            matches = self._scored_leads().search('Name', name).top_n('priority_score', 1)
             
-            for lead in scored:
-                if name.lower() in lead['Name'].lower():
-                    return json.dumps({
-                        "Name": lead['Name'],
-                        "Company": lead['Company'],
-                        "Email": lead.get('Email', 'N/A'),
-                        "Status": lead.get('Status', 'N/A'),
-                        "Score": lead['priority_score']
-                    }, indent=2)
+            for lead in matches:
+                return json.dumps({
+                    "Name": lead['Name'],
+                    "Company": lead['Company'],
+                    "Email": lead.get('Email') or 'N/A',
+                    "Status": lead.get('Status') or 'N/A',
+                    "Score": lead['priority_score']
+                }, indent=2)
             return f"Lead '{name}' not found"
         
         @tool
         def generate_followup_for_lead(lead_name: str) -> str:
             """Generate personalized follow-up actions for a specific lead by name."""
-            leads = self.sf_agent.get_leads()
-            scored = self.prioritizer.prioritize_leads(leads)
+            matches = self._scored_leads().search('Name', lead_name).top_n('priority_score', 1)
             
-            for lead in scored:
-                if lead_name.lower() in lead['Name'].lower():
-                    return self.followup_gen.generate_actions(lead, "lead")
+            for lead in matches:
+                return self.followup_gen.generate_actions(lead, "lead")
             return f"Lead '{lead_name}' not found"
         
         @tool
         def compare_leads(lead1_name: str, lead2_name: str) -> str:
             """Compare two leads and explain which one is better and why."""
-            leads = self.sf_agent.get_leads()
-            scored = self.prioritizer.prioritize_leads(leads)
-            
-            found_leads = []
-            for lead in scored:
-                if lead1_name.lower() in lead['Name'].lower() or lead2_name.lower() in lead['Name'].lower():
-                    found_leads.append(lead)
+            matches = self._scored_leads().search('Name', lead1_name, lead2_name)
+            found_leads = matches.top_n('priority_score', 2).to_records()
             
             if len(found_leads) < 2:
                 return "Could not find both leads for comparison"
@@ -91,65 +143,60 @@ class ConversationalSalesAgent:
         @tool
         def get_pipeline_summary() -> str:
             """Get quick pipeline summary with key metrics."""
-            leads = self.sf_agent.get_leads()
-            opps = self.sf_agent.get_opportunities()
-            scored_leads = self.prioritizer.prioritize_leads(leads)
-            scored_opps = self.scorer.score_opportunities(opps)
+            scored_leads, scored_opps = self._scored_pipeline()
             
-            total_value = sum(o['Amount'] for o in scored_opps if o['Amount'])
-            avg_lead_score = sum(l['priority_score'] for l in scored_leads) / len(scored_leads)
-            avg_opp_score = sum(o['conversion_score'] for o in scored_opps) / len(scored_opps)
+            lead_scores = scored_leads.summary('priority_score')
+            opp_scores = scored_opps.summary('conversion_score')
+            total_value = scored_opps.summary('Amount')['sum']
             
             return f"""📊 Quick Pipeline Summary:
-- Total Leads: {len(leads)} (Avg Score: {avg_lead_score:.1f})
-- Total Opportunities: {len(opps)}
+- Total Leads: {len(scored_leads)} (Avg Score: {lead_scores['mean']:.1f})
+- Total Opportunities: {len(scored_opps)}
 - Pipeline Value: ${total_value:,.0f}
-- Avg Opportunity Score: {avg_opp_score:.1f}"""
+- Avg Opportunity Score: {opp_scores['mean']:.1f}"""
         
         @tool
         def get_opportunity_summary(opportunity_name: str) -> str:
             """Get comprehensive summary and analysis for a specific opportunity by name."""
-            opps = self.sf_agent.get_opportunities()
-            scored = self.scorer.score_opportunities(opps)
+            scored = self._scored_opportunities()
+            matches = scored.search('Name', opportunity_name).top_n('conversion_score', 1)
             
-            for opp in scored:
-                if opportunity_name.lower() in opp['Name'].lower():
-                    summary = f"""📊 COMPREHENSIVE OPPORTUNITY ANALYSIS
+            for opp in matches:
+                amount = opp['Amount'] or 0
+                summary = f"""📊 COMPREHENSIVE OPPORTUNITY ANALYSIS
 
 🏢 Opportunity: {opp['Name']}
-💰 Amount: ${opp['Amount']:,.0f}
-📈 Stage: {opp.get('StageName', 'N/A')}
-📅 Close Date: {opp.get('CloseDate', 'N/A')}
+💰 Amount: ${amount:,.0f}
+📈 Stage: {opp.get('StageName') or 'N/A'}
+📅 Close Date: {opp.get('CloseDate') or 'N/A'}
 🎯 AI Conversion Score: {opp['conversion_score']}/100
-📊 Probability: {opp.get('Probability', 'N/A')}%
+📊 Probability: {opp.get('Probability') if opp.get('Probability') is not None else 'N/A'}%
 
 💡 INSIGHTS:
-- Score Ranking: #{scored.index(opp) + 1} out of {len(scored)} opportunities
+- Score Ranking: #{scored.rank_of('conversion_score', opp['Id'])} out of {len(scored)} opportunities
 - Risk Level: {'Low' if opp['conversion_score'] >= 75 else 'Medium' if opp['conversion_score'] >= 50 else 'High'}
-- Deal Size: {'Large' if opp['Amount'] > 200000 else 'Medium' if opp['Amount'] > 100000 else 'Small'}
+- Deal Size: {'Large' if amount > 200000 else 'Medium' if amount > 100000 else 'Small'}
 
 📝 RECOMMENDED ACTIONS:
 {self.followup_gen.generate_actions(opp, 'opportunity')}
 """
-                    return summary
+                return summary
             return f"Opportunity '{opportunity_name}' not found"
         
         @tool
         def get_all_opportunities_summary() -> str:
             """Get summary of all opportunities with key metrics and insights."""
-            opps = self.sf_agent.get_opportunities()
-            scored = self.scorer.score_opportunities(opps)
+            scored = self._scored_opportunities()
+            if not len(scored):
+                return "No open opportunities found"
             
-            total_value = sum(o['Amount'] for o in scored if o['Amount'])
-            avg_score = sum(o['conversion_score'] for o in scored) / len(scored)
-            high_value = [o for o in scored if o['Amount'] > 200000]
-            hot_deals = [o for o in scored if o['conversion_score'] >= 80]
-            
-            # Stage breakdown
-            stages = {}
-            for opp in scored:
-                stage = opp.get('StageName', 'Unknown')
-                stages[stage] = stages.get(stage, 0) + 1
+            total_value = scored.summary('Amount')['sum']
+            avg_score = scored.summary('conversion_score')['mean']
+            high_value = scored.where('Amount', '>', 200000)
+            hot_deals = scored.where('conversion_score', '>=', 80)
+            at_risk = scored.where('conversion_score', '<', 50)
+            stages = scored.group_count('StageName')
+            top_five = scored.top_n('conversion_score', 5)
             
             summary = f"""📊 COMPLETE OPPORTUNITY PIPELINE SUMMARY
 
@@ -162,21 +209,45 @@ class ConversationalSalesAgent:
 🎯 CONVERSION ANALYSIS:
 - Average AI Score: {avg_score:.1f}/100
 - Hot Deals (Score ≥80): {len(hot_deals)}
-- Deals Needing Attention (Score <50): {len([o for o in scored if o['conversion_score'] < 50])}
+- Deals Needing Attention (Score <50): {len(at_risk)}
 
 📈 STAGE BREAKDOWN:
 {chr(10).join([f'- {stage}: {count} deals' for stage, count in stages.items()])}
 
 🏆 TOP 5 OPPORTUNITIES:
-{chr(10).join([f'{i+1}. {o["Name"]} - ${o["Amount"]:,.0f} (Score: {o["conversion_score"]})' for i, o in enumerate(scored[:5])])}
+{chr(10).join([f'{i+1}. {o["Name"]} - ${o["Amount"] or 0:,.0f} (Score: {o["conversion_score"]})' for i, o in enumerate(top_five)])}
 
 ⚠️ PRIORITY ACTIONS:
 - Focus on {len(hot_deals)} hot deals with high conversion probability
-- Review {len([o for o in scored if o['conversion_score'] < 50])} underperforming opportunities
-- Total potential revenue at risk: ${sum(o['Amount'] for o in scored if o['conversion_score'] < 50):,.0f}
+- Review {len(at_risk)} underperforming opportunities
+- Total potential revenue at risk: ${at_risk.summary('Amount')['sum']:,.0f}
 """
             return summary
         
+        @tool
+        def find_lookalike_leads(n: int = 5) -> str:
+            """Find open leads that look like recently converted leads. Use this when user asks which leads resemble converted ones or for lookalike leads."""
+            matches = self.sf_agent.lookalike_leads(n)
+            if not matches:
+                return "No converted leads to compare against"
+            
+            result = f"Top {len(matches)} Lookalike Leads:\n"
+            for i, (lead, similarity) in enumerate(matches, 1):
+                result += f"{i}. {lead['Name']} ({lead['Company']}) - Similarity: {similarity:.2f}\n"
+            return result
+        
+        @tool
+        def find_similar_opportunities(opportunity_name: str, n: int = 5) -> str:
+            """Find open opportunities that resemble a given opportunity by name. Use this when user asks which deals look like a specific deal."""
+            target, matches = self.sf_agent.similar_opportunities(opportunity_name, n)
+            if target is None:
+                return f"Opportunity '{opportunity_name}' not found"
+            
+            result = f"Deals similar to {target['Name']}:\n"
+            for i, (opp, similarity) in enumerate(matches, 1):
+                result += f"{i}. {opp['Name']} - ${opp['Amount'] or 0:,.0f} ({opp.get('StageName') or 'N/A'}) - Similarity: {similarity:.2f}\n"
+            return result
+        
         tools = [
             get_top_leads,
             get_top_opportunities,
@@ -185,7 +256,9 @@ class ConversationalSalesAgent:
             compare_leads,
             get_pipeline_summary,
             get_opportunity_summary,
-            get_all_opportunities_summary
+            get_all_opportunities_summary,
+            find_lookalike_leads,
+            find_similar_opportunities
         ]
         
         return create_react_agent(self.llm, tools)
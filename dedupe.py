@@ -0,0 +1,62 @@
+import hashlib
+import json
+import re
+
+# Only these fields reach the lead scoring prompt, so leads that agree on them
+# (after normalisation) must get the same score and can share one GPT-4 call.
+LEAD_PROMPT_FIELDS = ('Company', 'EmailDomain', 'Status', 'Rating', 'LeadSource')
+
+# Lead columns those prompt fields are derived from
+LEAD_SOURCE_FIELDS = ('Company', 'Email', 'Status', 'Rating', 'LeadSource')
+
+_COMPANY_SUFFIXES = re.compile(r"\b(inc|incorporated|llc|ltd|limited|corp|corporation|co|company|plc|gmbh)\b")
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def email_domain(email):
+    return email.rsplit('@', 1)[-1].strip().lower() if email and '@' in email else None
+
+
+def lead_prompt_fields(lead):
+    """The subset of a lead that the scoring prompt is allowed to see."""
+    fields = {
+        'Company': lead.get('Company'),
+        'EmailDomain': email_domain(lead.get('Email')),
+        'Status': lead.get('Status'),
+        'Rating': lead.get('Rating'),
+        'LeadSource': lead.get('LeadSource'),
+    }
+    return {k: v for k, v in fields.items() if v}
+
+
+def _normalize(field, value):
+    value = _SPACES.sub(' ', str(value).lower()).strip()
+    if field == 'Company':
+        value = _SPACES.sub(' ', _COMPANY_SUFFIXES.sub('', _NON_WORD.sub(' ', value))).strip()
+    return value
+
+
+def lead_fingerprint(lead):
+    """Hash of the normalised prompt fields; equal for duplicate leads."""
+    fields = lead_prompt_fields(lead)
+    normalized = {k: _normalize(k, fields[k]) for k in LEAD_PROMPT_FIELDS if k in fields}
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def cluster(records, fingerprint=lead_fingerprint):
+    """Group record positions by fingerprint, in order of first appearance."""
+    clusters = {}
+    for i, record in enumerate(records):
+        clusters.setdefault(fingerprint(record), []).append(i)
+    return clusters
+
+
+def cluster_stats(clusters):
+    records = sum(len(members) for members in clusters.values())
+    return {
+        'records': records,
+        'clusters': len(clusters),
+        'duplicates': records - len(clusters),
+        'largest_cluster': max((len(members) for members in clusters.values()), default=0),
+    }
@@ -1,23 +1,83 @@
 from openai import OpenAI
+from transport import openai_http_client
+from dedupe import cluster, cluster_stats, lead_prompt_fields, LEAD_SOURCE_FIELDS
+from scoring_scheduler import DeadlineScheduler, lead_heuristic_score, opportunity_heuristic_score
 import json
 import os
+import re
+
+# Opportunity fields the scoring prompt sees
+OPP_PROMPT_FIELDS = ('Name', 'Amount', 'StageName', 'Probability', 'CloseDate')
+
+PROVISIONAL_REASON = "Provisional estimate; AI score still pending"
+
+_SCORE_REPLY = re.compile(r"\D*?(\d{1,3})\s*(?:/\s*100)?[\s\-:.,;)]*(.*)", re.S)
+
+
+def _parse_score_reply(content):
+    """(score, reason) from a "<score> - <brief reason>" reply; 50 if no score is found."""
+    match = _SCORE_REPLY.match(content or '')
+    if not match:
+        return 50, ''
+    return min(int(match.group(1)), 100), match.group(2).strip()
+
+
+def _with_reasons(results):
+    """Split scheduler results into scores, reasons and provisional flags."""
+    scores, reasons, provisional = [], [], []
+    for result, is_provisional in results:
+        score, reason = (result, PROVISIONAL_REASON) if is_provisional else result
+        scores.append(score)
+        reasons.append(reason)
+        provisional.append(is_provisional)
+    return scores, reasons, provisional
 
 class LeadPrioritizer:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=openai_http_client())
+        self.last_dedupe = None
+        self.scheduler = DeadlineScheduler(self._calculate_score, lead_heuristic_score)
         
-    def prioritize_leads(self, leads):
-        scored_leads = []
-        for lead in leads:
-            score = self._calculate_score(lead)
-            scored_leads.append({**lead, 'priority_score': score})
-        return sorted(scored_leads, key=lambda x: x['priority_score'], reverse=True)
+    def prioritize_leads(self, leads, budget=None, priority_ids=()):
+        """Score a RecordStore of leads; returns it with priority_score, highest first.
+        
+        With a `budget` in seconds, leads whose GPT-4 score isn't back in time get
+        a heuristic score and score_provisional=True; calling again later swaps in
+        the real scores once they finish in the background. Leads in
+        `priority_ids` (e.g. the rows on screen) are scored first.
+        """
+        store = leads
+        # Only the columns the prompt is built from are turned into dicts
+        leads = store.to_records(columns=['Id', *LEAD_SOURCE_FIELDS])
+        
+        # Duplicate leads (same normalised prompt fields) are scored once and
+        # the score is shared by every member of the cluster
+        clusters = cluster(leads)
+        self.last_dedupe = cluster_stats(clusters)
+        representatives = {key: leads[members[0]] for key, members in clusters.items()}
+        
+        if budget is None:
+            results = {key: (self._calculate_score(lead), False) for key, lead in representatives.items()}
+        else:
+            priority_ids = set(priority_ids)
+            priority = [key for key, members in clusters.items()
+                        if any(leads[i].get('Id') in priority_ids for i in members)]
+            results = self.scheduler.scores(representatives, budget, priority)
+        
+        per_lead = [None] * len(leads)
+        for key, members in clusters.items():
+            for i in members:
+                per_lead[i] = results[key]
+        scores, reasons, provisional = _with_reasons(per_lead)
+        return store.assign(priority_score=scores, score_reason=reasons,
+                            score_provisional=provisional).top_n('priority_score')
     
     def _calculate_score(self, lead):
-        prompt = f"""Analyze this lead and return ONLY a number 0-100:
-{json.dumps(lead)}
+        """(score, reason) for one lead."""
+        prompt = f"""Analyze this lead and score it 0-100 for conversion likelihood:
+{json.dumps(lead_prompt_fields(lead))}
 Consider: Rating, Status, LeadSource, Company size indicators.
-Score only:"""
+Reply as: <score> - <brief reason>"""
         
         response = self.client.chat.completions.create(
             model="gpt-4",
@@ -25,27 +85,40 @@ Score only:"""
             temperature=0
         )
         
-        try:
-            return int(''.join(filter(str.isdigit, response.choices[0].message.content[:3])))
-        except:
-            return 50
+        return _parse_score_reply(response.choices[0].message.content)
+
+def _opp_prompt_fields(opp):
+    return {k: opp.get(k) for k in OPP_PROMPT_FIELDS}
 
 class OpportunityScorer:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=openai_http_client())
+        self.scheduler = DeadlineScheduler(self._calculate_score, opportunity_heuristic_score)
+        
+    def score_opportunities(self, opportunities, budget=None, priority_ids=()):
+        """Score a RecordStore of opportunities, highest first; `budget` and `priority_ids` work as in LeadPrioritizer."""
+        store = opportunities
+        opportunities = store.to_records(columns=['Id', *OPP_PROMPT_FIELDS])
+        if budget is None:
+            results = [(self._calculate_score(opp), False) for opp in opportunities]
+        else:
+            # Keyed on the full prompt payload so an edited opportunity is rescored
+            keys = [json.dumps(_opp_prompt_fields(opp), sort_keys=True, default=str) for opp in opportunities]
+            priority_ids = set(priority_ids)
+            priority = [key for key, opp in zip(keys, opportunities) if opp.get('Id') in priority_ids]
+            by_key = self.scheduler.scores(dict(zip(keys, opportunities)), budget, priority)
+            results = [by_key[key] for key in keys]
         
-    def score_opportunities(self, opportunities):
-        scored_opps = []
-        for opp in opportunities:
-            score = self._calculate_score(opp)
-            scored_opps.append({**opp, 'conversion_score': score})
-        return sorted(scored_opps, key=lambda x: x['conversion_score'], reverse=True)
+        scores, reasons, provisional = _with_reasons(results)
+        return store.assign(conversion_score=scores, score_reason=reasons,
+                            score_provisional=provisional).top_n('conversion_score')
     
     def _calculate_score(self, opp):
+        """(score, reason) for one opportunity."""
         prompt = f"""Score this opportunity 0-100 for close likelihood:
-{json.dumps(opp)}
+{json.dumps(_opp_prompt_fields(opp))}
 Consider: Amount, StageName, Probability, CloseDate proximity.
-Score only:"""
+Reply as: <score> - <brief reason>"""
         
         response = self.client.chat.completions.create(
             model="gpt-4",
@@ -53,14 +126,11 @@ Score only:"""
             temperature=0
         )
         
-        try:
-            return int(''.join(filter(str.isdigit, response.choices[0].message.content[:3])))
-        except:
-            return 50
+        return _parse_score_reply(response.choices[0].message.content)
 
 class FollowUpGenerator:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=openai_http_client())
         
     def generate_actions(self, record, record_type="lead"):
         prompt = f"""Generate 3 specific follow-up actions for this {record_type}:
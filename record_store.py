@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+# Column types for the Salesforce objects we load. Low-cardinality picklists are
+# stored as categories so 100k-row frames stay small.
+LEAD_COLUMNS = {
+    'Id': 'string',
+    'Name': 'string',
+    'Email': 'string',
+    'Company': 'string',
+    'Status': 'category',
+    'LeadSource': 'category',
+    'Rating': 'category',
+    'priority_score': 'int16',
+    'score_reason': 'string',
+    'score_provisional': 'bool',
+}
+
+OPPORTUNITY_COLUMNS = {
+    'Id': 'string',
+    'Name': 'string',
+    'Amount': 'float64',
+    'StageName': 'category',
+    'Probability': 'float32',
+    'CloseDate': 'datetime64[ns]',
+    'AccountId': 'string',
+    'conversion_score': 'int16',
+    'score_reason': 'string',
+    'score_provisional': 'bool',
+}
+
+_OPS = {
+    '==': lambda col, v: col == v,
+    '!=': lambda col, v: col != v,
+    '>': lambda col, v: col > v,
+    '>=': lambda col, v: col >= v,
+    '<': lambda col, v: col < v,
+    '<=': lambda col, v: col <= v,
+    'in': lambda col, v: col.isin(v),
+}
+
+
+def _coerce(series, dtype):
+    if dtype.startswith('datetime'):
+        return pd.to_datetime(series, errors='coerce')
+    if dtype.startswith(('int', 'float')):
+        values = pd.to_numeric(series, errors='coerce')
+        if dtype.startswith('int') and values.isna().any():
+            return values.astype('Int16' if dtype == 'int16' else 'Int64')
+        return values.astype(dtype)
+    return series.astype(dtype)
+
+
+class RecordStore:
+    """Typed, column-oriented view over Salesforce records."""
+
+    def __init__(self, df, columns=None):
+        self.df = df
+        self.columns = columns or {}
+
+    @classmethod
+    def from_records(cls, records, columns):
+        """Build a store from SOQL rows, dropping the `attributes` payload."""
+        df = pd.DataFrame.from_records(records or [])
+        df = df.drop(columns=['attributes'], errors='ignore')
+        if df.empty:
+            df = pd.DataFrame(columns=list(columns))
+        for name, dtype in columns.items():
+            if name in df.columns:
+                df[name] = _coerce(df[name], dtype)
+        return cls(df.reset_index(drop=True), columns)
+
+    def __len__(self):
+        return len(self.df)
+
+    def __iter__(self):
+        return iter(self.to_records())
+
+    def _wrap(self, df):
+        return RecordStore(df, self.columns)
+
+    def to_records(self, columns=None):
+        """Rows as plain dicts (for LLM prompts and JSON), NaN mapped to None.
+
+        Pass `columns` to convert only the fields a caller needs.
+        """
+        df = self.df if columns is None else self.df[[c for c in columns if c in self.df.columns]]
+        df = df.copy()
+        for name in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[name]):
+                df[name] = df[name].dt.strftime('%Y-%m-%d')
+        df = df.astype(object).where(df.notna(), None)
+        return df.to_dict('records')
+
+    def column(self, name):
+        return self.df[name]
+
+    def assign(self, **values):
+        """New store with the given columns added or replaced (typed per schema)."""
+        df = self.df.copy()
+        for name, column in values.items():
+            df[name] = column
+            if name in self.columns:
+                df[name] = _coerce(df[name], self.columns[name])
+        return self._wrap(df)
+
+    def where(self, column, op, value):
+        """Keep rows where `column <op> value`, evaluated over the whole column."""
+        return self._wrap(self.df[_OPS[op](self.df[column], value)])
+
+    def search(self, column, *texts):
+        """Case-insensitive substring match on a text column (any of `texts`)."""
+        mask = np.zeros(len(self.df), dtype=bool)
+        for text in texts:
+            mask |= self.df[column].str.contains(text, case=False, regex=False, na=False).to_numpy(dtype=bool)
+        return self._wrap(self.df[mask])
+
+    def top_n(self, column, n=None):
+        """Rows with the largest `column` values, highest first."""
+        if n is None:
+            return self._wrap(self.df.sort_values(column, ascending=False, kind='stable'))
+        return self._wrap(self.df.nlargest(n, column, keep='first'))
+
+    def head(self, n):
+        return self._wrap(self.df.head(n))
+
+    def by_ids(self, ids):
+        """Rows for the given Ids, in that order."""
+        return self._wrap(self.df.set_index('Id', drop=False).loc[list(ids)].reset_index(drop=True))
+
+    def rank_of(self, column, row_id):
+        """1-based rank of the row with Id `row_id` when ordered by `column`."""
+        ranks = self.df[column].rank(ascending=False, method='first')
+        return int(ranks[self.df['Id'] == row_id].iloc[0])
+
+    def group_count(self, column):
+        """Row counts per value of `column`, missing values counted as Unknown."""
+        counts = self.df[column].astype(object).fillna('Unknown').value_counts(sort=False)
+        return counts[counts > 0]
+
+    def summary(self, column):
+        """Count, sum, mean, min and max of a numeric column."""
+        values = self.df[column]
+        if values.empty:
+            return {'count': 0, 'sum': 0.0, 'mean': 0.0, 'min': None, 'max': None}
+        return {
+            'count': int(values.count()),
+            'sum': float(values.sum()),
+            'mean': float(values.mean()),
+            'min': values.min(),
+            'max': values.max(),
+        }
+
+    def histogram(self, column, bins=10, range=None):
+        """Bin counts and edges for a numeric column."""
+        values = self.df[column].dropna().to_numpy(dtype=float)
+        return np.histogram(values, bins=bins, range=range)
@@ -2,36 +2,56 @@ from openai import OpenAI
 from simple_salesforce import Salesforce
 import os
 from functools import lru_cache
+from record_store import RecordStore, LEAD_COLUMNS, OPPORTUNITY_COLUMNS
+from similarity_index import (SimilarityIndex, lead_text, opportunity_text,
+                              LEAD_TEXT_FIELDS, OPPORTUNITY_TEXT_FIELDS)
+from transport import openai_http_client, salesforce_session
+from dedupe import lead_fingerprint, lead_prompt_fields
 
 class SalesforceAgent:
     def __init__(self, sf_username, sf_password, sf_token, limit=200):
-        self.sf = Salesforce(username=sf_username, password=sf_password, security_token=sf_token)
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.sf = Salesforce(username=sf_username, password=sf_password, security_token=sf_token, session=salesforce_session())
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=openai_http_client())
         self._cache = {}
         self.limit = limit
         
+        # Persisted by default so a new session reuses embeddings instead of recomputing them
+        index_dir = os.getenv("SIMILARITY_INDEX_DIR", ".similarity_index")
+        self.lead_index = SimilarityIndex(os.path.join(index_dir, "leads"), client=self.client)
+        self.opp_index = SimilarityIndex(os.path.join(index_dir, "opportunities"), client=self.client)
+        
     @lru_cache(maxsize=32)
     def get_leads(self, query=""):
         soql = f"SELECT Id, Name, Email, Company, Status, LeadSource, Rating FROM Lead WHERE IsConverted = false LIMIT {self.limit}"
         try:
-            return self.sf.query(soql)['records']
+            return self.sf.query_all(soql)['records']
         except Exception as e:
             return f"Error fetching leads: {str(e)}"
     
+    @lru_cache(maxsize=32)
+    def get_converted_leads(self, query=""):
+        soql = f"SELECT Id, Name, Email, Company, Status, LeadSource, Rating FROM Lead WHERE IsConverted = true ORDER BY ConvertedDate DESC LIMIT {self.limit}"
+        try:
+            return self.sf.query_all(soql)['records']
+        except Exception as e:
+            return f"Error fetching converted leads: {str(e)}"
+    
     @lru_cache(maxsize=32)
     def get_opportunities(self, query=""):
         soql = f"SELECT Id, Name, Amount, StageName, Probability, CloseDate, AccountId FROM Opportunity WHERE IsClosed = false LIMIT {self.limit}"
         try:
-            return self.sf.query(soql)['records']
+            return self.sf.query_all(soql)['records']
         except Exception as e:
             return f"Error fetching opportunities: {str(e)}"
     
     def score_lead(self, lead_data):
-        if str(lead_data) in self._cache:
-            return self._cache[str(lead_data)]
+        # Keyed on the normalised prompt fields so duplicate leads share a result
+        key = ('lead', lead_fingerprint(lead_data))
+        if key in self._cache:
+            return self._cache[key]
         
         prompt = f"""Score this lead from 0-100 based on conversion likelihood:
-Lead: {lead_data}
+Lead: {lead_prompt_fields(lead_data)}
 Return only the numeric score and brief reason."""
         
         response = self.client.chat.completions.create(
@@ -40,7 +60,7 @@ Return only the numeric score and brief reason."""
             temperature=0
         )
         result = response.choices[0].message.content
-        self._cache[str(lead_data)] = result
+        self._cache[key] = result
         return result
     
     def score_opportunity(self, opp_data):
@@ -71,3 +91,30 @@ Be specific and actionable."""
             temperature=0.7
         )
         return response.choices[0].message.content
+    
+    def lookalike_leads(self, n=5):
+        """Open leads most similar to the most recently converted ones."""
+        leads = RecordStore.from_records(self.get_leads(), LEAD_COLUMNS)
+        converted = RecordStore.from_records(self.get_converted_leads(), LEAD_COLUMNS)
+        self.lead_index.upsert(leads.to_records(columns=LEAD_TEXT_FIELDS)
+                               + converted.to_records(columns=LEAD_TEXT_FIELDS), lead_text)
+        
+        matches = self.lead_index.similar_to(list(converted.column('Id')), k=n, among=list(leads.column('Id')))
+        found = leads.by_ids(record_id for record_id, _ in matches).to_records()
+        return [(lead, similarity) for lead, (_, similarity) in zip(found, matches)]
+    
+    def similar_opportunities(self, opportunity_name=None, n=5, opportunity_id=None):
+        """Open opportunities most similar to the one with `opportunity_id`, or else
+        the first whose name contains `opportunity_name` (for free-text lookups)."""
+        opps = RecordStore.from_records(self.get_opportunities(), OPPORTUNITY_COLUMNS)
+        self.opp_index.upsert(opps.to_records(columns=OPPORTUNITY_TEXT_FIELDS), opportunity_text)
+        
+        if opportunity_id is not None:
+            target = opps.where('Id', '==', opportunity_id).to_records()
+        else:
+            target = opps.search('Name', opportunity_name).head(1).to_records()
+        if not target:
+            return None, []
+        matches = self.opp_index.similar_to([target[0]['Id']], k=n, among=list(opps.column('Id')))
+        found = opps.by_ids(record_id for record_id, _ in matches).to_records()
+        return target[0], [(opp, similarity) for opp, (_, similarity) in zip(found, matches)]
@@ -0,0 +1,136 @@
+from datetime import datetime, timezone
+import json
+import os
+
+# Custom fields the scores are written to; override per org with env vars.
+LEAD_FIELDS = {
+    'object': 'Lead',
+    'score_key': 'priority_score',
+    'score_field': os.getenv("SF_LEAD_SCORE_FIELD", "AI_Priority_Score__c"),
+    'reason_field': os.getenv("SF_LEAD_REASON_FIELD", "AI_Score_Reason__c"),
+    'timestamp_field': os.getenv("SF_LEAD_SCORED_AT_FIELD", "AI_Scored_At__c"),
+}
+
+OPPORTUNITY_FIELDS = {
+    'object': 'Opportunity',
+    'score_key': 'conversion_score',
+    'score_field': os.getenv("SF_OPP_SCORE_FIELD", "AI_Conversion_Score__c"),
+    'reason_field': os.getenv("SF_OPP_REASON_FIELD", "AI_Score_Reason__c"),
+    'timestamp_field': os.getenv("SF_OPP_SCORED_AT_FIELD", "AI_Scored_At__c"),
+}
+
+COLLECTION_SIZE = 200    # max records per composite/sobjects request
+QUERY_CHUNK = 300        # ids per SOQL IN clause, keeps the URL well under limits
+BULK_THRESHOLD = 5000    # above this many changed rows, use the Bulk API
+
+
+class ScoreWriteBack:
+    """Upserts AI scores into Salesforce custom fields.
+
+    `sf` is a simple_salesforce.Salesforce. Only records whose stored score
+    differs from the new one are written. Writes use composite sObject
+    collections (200 per request, allOrNone=false) or the Bulk API for large
+    volumes, and per-record failures are collected rather than raised.
+
+    To test without an org, build `sf` with `Salesforce(instance_url=...,
+    session_id=..., session=...)` where the requests session has an adapter
+    mounted that serves the fake endpoint.
+    """
+
+    def __init__(self, sf, fields, reason_key='score_reason', bulk_threshold=BULK_THRESHOLD):
+        self.sf = sf
+        self.fields = fields
+        self.reason_key = reason_key
+        self.bulk_threshold = bulk_threshold
+
+    def current_scores(self, ids):
+        """Scores currently stored in Salesforce, by record Id."""
+        score_field = self.fields['score_field']
+        current = {}
+        for start in range(0, len(ids), QUERY_CHUNK):
+            chunk = ids[start:start + QUERY_CHUNK]
+            id_list = ", ".join(f"'{record_id}'" for record_id in chunk)
+            soql = f"SELECT Id, {score_field} FROM {self.fields['object']} WHERE Id IN ({id_list})"
+            for row in self.sf.query_all(soql)['records']:
+                current[row['Id']] = row.get(score_field)
+        return current
+
+    def changed_rows(self, records):
+        """Field updates for records whose score differs from the stored one.
+
+        `records` should already be eligible (see write()): they have an Id and a
+        final, non-provisional score.
+        """
+        score_key = self.fields['score_key']
+        current = self.current_scores([r['Id'] for r in records])
+        scored_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        rows = []
+        for record in records:
+            stored = current.get(record['Id'])
+            if stored is not None and int(stored) == int(record[score_key]):
+                continue
+            row = {
+                'Id': record['Id'],
+                self.fields['score_field']: int(record[score_key]),
+                self.fields['timestamp_field']: scored_at,
+            }
+            if record.get(self.reason_key):
+                row[self.fields['reason_field']] = str(record[self.reason_key])[:255]
+            rows.append(row)
+        return rows
+
+    def _write_collections(self, rows):
+        results = []
+        for start in range(0, len(rows), COLLECTION_SIZE):
+            chunk = rows[start:start + COLLECTION_SIZE]
+            payload = {
+                'allOrNone': False,
+                'records': [
+                    {'attributes': {'type': self.fields['object']}, 'id': row['Id'],
+                     **{k: v for k, v in row.items() if k != 'Id'}}
+                    for row in chunk
+                ],
+            }
+            try:
+                response = self.sf.restful('composite/sobjects', method='PATCH', data=json.dumps(payload))
+            except Exception as e:
+                # A failed request fails every record in it, the rest carry on
+                response = [{'success': False, 'errors': [{'message': str(e)}]} for _ in chunk]
+            for row, result in zip(chunk, response):
+                results.append({'Id': row['Id'], 'success': result.get('success', False),
+                                'errors': result.get('errors', [])})
+        return results
+
+    def _write_bulk(self, rows):
+        try:
+            response = getattr(self.sf.bulk, self.fields['object']).update(rows, batch_size=10000)
+        except Exception as e:
+            response = [{'success': False, 'errors': [{'message': str(e)}]} for _ in rows]
+        return [{'Id': row['Id'], 'success': result.get('success', False), 'errors': result.get('errors', [])}
+                for row, result in zip(rows, response)]
+
+    def write(self, records):
+        """Write changed scores; returns counts plus the records that failed.
+
+        Every checked record lands in exactly one of: unscored (no Id or score),
+        provisional (heuristic score, never written), unchanged, written, failed.
+        """
+        score_key = self.fields['score_key']
+        scored = [r for r in records if r.get('Id') and r.get(score_key) is not None]
+        eligible = [r for r in scored if not r.get('score_provisional')]
+        rows = self.changed_rows(eligible)
+        if len(rows) > self.bulk_threshold:
+            results = self._write_bulk(rows)
+        else:
+            results = self._write_collections(rows)
+
+        failed = [r for r in results if not r['success']]
+        return {
+            'checked': len(records),
+            'unscored': len(records) - len(scored),
+            'provisional': len(scored) - len(eligible),
+            'unchanged': len(eligible) - len(rows),
+            'written': len(results) - len(failed),
+            'failed': failed,
+        }
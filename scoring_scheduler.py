@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+import threading
+import time
+
+# Finished scores kept per scheduler; matches the largest record limit in the app
+RESULT_CACHE_SIZE = 50000
+
+_RATING_SCORES = {'hot': 85, 'warm': 65, 'cold': 35}
+_STATUS_ADJUSTMENTS = {'working - contacted': 5, 'closed - not converted': -30, 'unqualified': -30}
+
+
+def lead_heuristic_score(lead):
+    """Instant 0-100 estimate from Rating and Status, used until the GPT-4 score arrives."""
+    score = _RATING_SCORES.get(str(lead.get('Rating') or '').lower(), 50)
+    score += _STATUS_ADJUSTMENTS.get(str(lead.get('Status') or '').lower(), 0)
+    return max(0, min(100, score))
+
+
+def opportunity_heuristic_score(opp):
+    """Instant 0-100 estimate: the stage probability Salesforce already tracks."""
+    probability = opp.get('Probability')
+    return int(round(float(probability))) if probability is not None else 50
+
+
+class DeadlineScheduler:
+    """Runs per-record scoring calls against a latency budget.
+
+    Calls are queued highest expected value first (ids the caller marks as
+    priority, e.g. visible rows, then by heuristic score) on a shared thread
+    pool. Whatever hasn't finished when the budget runs out gets its heuristic
+    score and is flagged provisional; its real call keeps running in the
+    background and is picked up by the next scores() call for the same key.
+
+    Keys are content fingerprints, so a finished score stays valid for as long
+    as the record is unchanged. The last `max_results` of them are kept (least
+    recently used dropped first) and later calls reuse them instead of calling
+    again; clear() forgets them, e.g. when the data is refetched. Failed calls
+    are not kept and are retried on the next request.
+    """
+
+    def __init__(self, score_fn, heuristic_fn, max_workers=8, max_results=RESULT_CACHE_SIZE):
+        self.score_fn = score_fn
+        self.heuristic_fn = heuristic_fn
+        self.max_results = max_results
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _submit(self, key, record):
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                future = self._executor.submit(self.score_fn, record)
+                self._futures[key] = future
+            return future
+
+    def _cached(self, keys):
+        with self._lock:
+            found = {key: self._results[key] for key in keys if key in self._results}
+            for key in found:
+                self._results.move_to_end(key)
+        return found
+
+    def _settle(self, futures):
+        """Move finished calls into the result cache; failed ones are just dropped."""
+        with self._lock:
+            for key, future in futures.items():
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+                if future.exception() is None:
+                    self._results[key] = future.result()
+                    self._results.move_to_end(key)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        """Forget finished scores; calls still in flight are delivered as usual."""
+        with self._lock:
+            self._results.clear()
+
+    def scores(self, records, budget=None, priority=()):
+        """{key: (score, provisional)} for a {key: record} mapping.
+
+        With `budget` None every call is awaited and nothing is provisional.
+        """
+        deadline = None if budget is None else time.monotonic() + budget
+        cached = self._cached(records)
+        priority = set(priority)
+        heuristics = {key: self.heuristic_fn(record) for key, record in records.items() if key not in cached}
+        order = sorted(heuristics, key=lambda key: (key not in priority, -heuristics[key]))
+        futures = {key: self._submit(key, records[key]) for key in order}
+
+        remaining = None if deadline is None else max(0, deadline - time.monotonic())
+        wait(futures.values(), timeout=remaining)
+
+        results = {key: (score, False) for key, score in cached.items()}
+        finished = {}
+        for key, future in futures.items():
+            if not future.done():
+                results[key] = (heuristics[key], True)
+                continue
+            finished[key] = future
+            if future.exception() is None:
+                results[key] = (future.result(), False)
+            else:
+                results[key] = (heuristics[key], True)
+        self._settle(finished)
+        return results
@@ -0,0 +1,182 @@
+from openai import OpenAI
+from transport import openai_http_client
+import numpy as np
+import hashlib
+import json
+import os
+
+
+# Record fields the embedding texts are built from
+LEAD_TEXT_FIELDS = ('Id', 'Company', 'Email', 'Status', 'LeadSource', 'Rating')
+OPPORTUNITY_TEXT_FIELDS = ('Id', 'Name', 'StageName', 'Amount', 'Probability')
+
+
+def lead_text(lead):
+    """Text used to embed a lead: firmographics rather than the person's name."""
+    email = lead.get('Email') or ''
+    domain = email.split('@')[-1] if '@' in email else ''
+    return (f"Company: {lead.get('Company') or ''}; Domain: {domain}; "
+            f"Status: {lead.get('Status') or ''}; Source: {lead.get('LeadSource') or ''}; "
+            f"Rating: {lead.get('Rating') or ''}")
+
+
+def opportunity_text(opp):
+    """Text used to embed an opportunity."""
+    amount = opp.get('Amount') or 0
+    return (f"Opportunity: {opp.get('Name') or ''}; Stage: {opp.get('StageName') or ''}; "
+            f"Amount: {amount:,.0f}; Probability: {opp.get('Probability') or 0}%")
+
+
+class SimilarityIndex:
+    """Cosine top-k search over record embeddings kept in one float32 matrix.
+
+    Vectors are L2-normalised on insert, so a search is a single matrix-vector
+    product. With `path` set the matrix is saved as `<path>.npy` and reopened
+    memory-mapped; ids and content hashes live next to it in `<path>.json`.
+    """
+
+    def __init__(self, path=None, model="text-embedding-3-small", dim=256, batch_size=512, client=None):
+        self.path = path
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+        self._client = client
+        self.ids = []
+        self._pos = {}
+        self._hashes = {}
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._size = 0
+        if path and os.path.exists(f"{path}.npy"):
+            self._load()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=openai_http_client())
+        return self._client
+
+    @property
+    def vectors(self):
+        return self._vectors[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, record_id):
+        return record_id in self._pos
+
+    def _load(self):
+        with open(f"{self.path}.json") as f:
+            meta = json.load(f)
+        self.ids = meta['ids']
+        self._hashes = meta['hashes']
+        self._pos = {record_id: i for i, record_id in enumerate(self.ids)}
+        self._vectors = np.load(f"{self.path}.npy", mmap_mode='r')
+        self._size = len(self.ids)
+        self.dim = self._vectors.shape[1]
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Write to temp files first so a reader never sees a half-written index
+        np.save(f"{self.path}.tmp.npy", np.ascontiguousarray(self.vectors))
+        with open(f"{self.path}.tmp.json", 'w') as f:
+            json.dump({'ids': self.ids, 'hashes': self._hashes}, f)
+        os.replace(f"{self.path}.tmp.npy", f"{self.path}.npy")
+        os.replace(f"{self.path}.tmp.json", f"{self.path}.json")
+
+    def embed(self, texts):
+        """Embed `texts` in batches and return an (n, dim) normalised matrix."""
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            response = self.client.embeddings.create(model=self.model, input=batch, dimensions=self.dim)
+            out[start:start + len(batch)] = [item.embedding for item in response.data]
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        if needed <= len(self._vectors) and self._vectors.flags.writeable:
+            return
+        capacity = max(needed, 2 * len(self._vectors), 1024)
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[:self._size] = self._vectors[:self._size]
+        self._vectors = grown
+
+    def upsert(self, records, text_fn):
+        """Embed new or changed records and store them; returns the number embedded.
+
+        Records whose text hasn't changed since the last upsert are skipped, so
+        calling this on every refresh only pays for what actually changed.
+        """
+        pending = {}
+        for record in records:
+            text = text_fn(record)
+            digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            if self._hashes.get(record['Id']) != digest:
+                pending[record['Id']] = (text, digest)
+        if not pending:
+            return 0
+
+        ids = list(pending)
+        vectors = self.embed([pending[record_id][0] for record_id in ids])
+        self._reserve(sum(1 for record_id in ids if record_id not in self._pos))
+        for record_id, vector in zip(ids, vectors):
+            row = self._pos.get(record_id)
+            if row is None:
+                row = self._size
+                self._pos[record_id] = row
+                self.ids.append(record_id)
+                self._size += 1
+            self._vectors[row] = vector
+            self._hashes[record_id] = pending[record_id][1]
+        self.save()
+        return len(ids)
+
+    def vector(self, record_id):
+        return self.vectors[self._pos[record_id]]
+
+    def centroid(self, record_ids):
+        """Normalised mean vector of the indexed records among `record_ids`."""
+        rows = [self._pos[record_id] for record_id in record_ids if record_id in self._pos]
+        if not rows:
+            return None
+        mean = self.vectors[rows].mean(axis=0)
+        return mean / max(np.linalg.norm(mean), 1e-12)
+
+    def search(self, query, k=5, among=None, exclude=()):
+        """Top-k (id, cosine similarity) pairs for `query`.
+
+        `query` is a vector or a string (embedded with one API call). `among`
+        limits candidates to the given ids; `exclude` drops ids from the result.
+        """
+        if self._size == 0:
+            return []
+        if isinstance(query, str):
+            query = self.embed([query])[0]
+        scores = self.vectors @ np.asarray(query, dtype=np.float32)
+
+        mask = np.ones(self._size, dtype=bool)
+        if among is not None:
+            mask[:] = False
+            mask[[self._pos[record_id] for record_id in among if record_id in self._pos]] = True
+        for record_id in exclude:
+            if record_id in self._pos:
+                mask[self._pos[record_id]] = False
+        scores = np.where(mask, scores, -np.inf)
+
+        k = min(k, int(mask.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    def similar_to(self, record_ids, k=5, among=None):
+        """Records most similar to the centroid of `record_ids`, excluding them."""
+        query = self.centroid(record_ids)
+        if query is None:
+            return []
+        return self.search(query, k=k, among=among, exclude=record_ids)
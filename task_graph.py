@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+import time
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class TaskGraph:
+    """Runs named tasks on a thread pool as soon as their dependencies finish.
+
+    Each task is called with the results of its dependencies as positional
+    arguments, so independent branches (e.g. fetch+score leads, fetch+score
+    opportunities) overlap and total latency is that of the slowest branch.
+
+        graph = TaskGraph()
+        graph.add('leads', lambda: RecordStore.from_records(agent.get_leads(), LEAD_COLUMNS))
+        graph.add('scored', prioritizer.prioritize_leads, 'leads')
+        results = graph.run(timeout=60)
+
+    The first failing task cancels everything not yet started and its
+    exception is re-raised from run(). cancel() may be called from another
+    thread; running tasks can poll `graph.cancelled` to stop early. The flag is
+    cleared when run() starts, so a graph can be run again.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.cancelled = threading.Event()
+        self._tasks = {}
+
+    def add(self, name, fn, *deps):
+        if name in self._tasks:
+            raise ValueError(f"Duplicate task {name!r}")
+        missing = [dep for dep in deps if dep not in self._tasks]
+        if missing:
+            raise ValueError(f"Task {name!r} depends on unknown tasks {missing}")
+        self._tasks[name] = (fn, deps)
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self, timeout=None):
+        """Run every task and return {name: result}."""
+        self.cancelled.clear()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        results = {}
+        running = {}
+        pending = dict(self._tasks)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                if self.cancelled.is_set():
+                    raise TaskCancelled("Task graph was cancelled")
+
+                for name, (fn, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        running[executor.submit(fn, *(results[dep] for dep in deps))] = name
+                        del pending[name]
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Tasks still running after {timeout}s: {sorted(running.values())}")
+                # Wake up periodically so cancel() is noticed promptly
+                done, _ = wait(running, timeout=0.1 if remaining is None else min(remaining, 0.1),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+        except BaseException:
+            self.cancelled.set()
+            raise
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
@@ -0,0 +1,176 @@
+import json
+import os
+import re
+import sys
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from simple_salesforce import Salesforce
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from score_writeback import ScoreWriteBack, LEAD_FIELDS, COLLECTION_SIZE
+
+SCORE_FIELD = LEAD_FIELDS['score_field']
+REASON_FIELD = LEAD_FIELDS['reason_field']
+
+
+class FakeSalesforce(BaseAdapter):
+    """Serves SOQL queries and composite/sobjects PATCHes from memory."""
+
+    def __init__(self, stored_scores=None, failing_ids=()):
+        super().__init__()
+        self.stored_scores = stored_scores or {}
+        self.failing_ids = set(failing_ids)
+        self.patches = []
+
+    def send(self, request, **kwargs):
+        if request.method == 'GET' and '/query' in request.url:
+            soql = parse_qs(urlparse(request.url).query)['q'][0]
+            ids = re.findall(r"'([^']+)'", soql)
+            records = [{'Id': i, SCORE_FIELD: self.stored_scores[i]} for i in ids if i in self.stored_scores]
+            body = {'totalSize': len(records), 'done': True, 'records': records}
+        elif request.method == 'PATCH' and request.url.endswith('/composite/sobjects'):
+            records = json.loads(request.body)['records']
+            self.patches.append(records)
+            body = [
+                {'id': r['id'], 'success': False, 'errors': [{'message': 'FIELD_INTEGRITY_EXCEPTION'}]}
+                if r['id'] in self.failing_ids else {'id': r['id'], 'success': True, 'errors': []}
+                for r in records
+            ]
+        else:
+            raise AssertionError(f"Unexpected request {request.method} {request.url}")
+
+        response = Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(body).encode('utf-8')
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeBulkType:
+    """Stands in for sf.bulk.<Object>; records update() calls."""
+
+    def __init__(self, failing_ids=(), error=None):
+        self.failing_ids = set(failing_ids)
+        self.error = error
+        self.updates = []
+
+    def update(self, rows, batch_size=10000):
+        self.updates.append(rows)
+        if self.error:
+            raise self.error
+        return [
+            {'id': row['Id'], 'success': False, 'created': False,
+             'errors': [{'message': 'FIELD_INTEGRITY_EXCEPTION', 'statusCode': 'FIELD_INTEGRITY_EXCEPTION'}]}
+            if row['Id'] in self.failing_ids else {'id': row['Id'], 'success': True, 'created': False, 'errors': []}
+            for row in rows
+        ]
+
+
+class FakeBulk:
+    def __init__(self, bulk_type):
+        self.Lead = bulk_type
+
+
+def make_writer(fake, bulk=None, **kwargs):
+    session = requests.Session()
+    session.mount('https://', fake)
+    sf = Salesforce(instance_url='https://fake.my.salesforce.com', session_id='fake-session', session=session)
+    if bulk is not None:
+        sf.bulk = FakeBulk(bulk)
+    return ScoreWriteBack(sf, LEAD_FIELDS, **kwargs)
+
+
+def lead(record_id, score, **extra):
+    return {'Id': record_id, 'priority_score': score, **extra}
+
+
+def test_unchanged_rows_are_skipped():
+    fake = FakeSalesforce(stored_scores={'L1': 80, 'L2': 40})
+    report = make_writer(fake).write([lead('L1', 80), lead('L2', 55, score_reason='Warm web lead')])
+
+    assert report['unchanged'] == 1
+    assert report['written'] == 1
+    assert [r['id'] for r in fake.patches[0]] == ['L2']
+    assert fake.patches[0][0][SCORE_FIELD] == 55
+    assert fake.patches[0][0][REASON_FIELD] == 'Warm web lead'
+    assert LEAD_FIELDS['timestamp_field'] in fake.patches[0][0]
+
+
+def test_writes_are_chunked_into_collections_of_200():
+    fake = FakeSalesforce()
+    records = [lead(f'L{i}', 70) for i in range(450)]
+    report = make_writer(fake).write(records)
+
+    assert [len(chunk) for chunk in fake.patches] == [COLLECTION_SIZE, COLLECTION_SIZE, 50]
+    assert report['written'] == 450
+    assert report['failed'] == []
+
+
+def test_partial_failure_is_reported():
+    fake = FakeSalesforce(failing_ids={'L2'})
+    report = make_writer(fake).write([lead('L1', 90), lead('L2', 20), lead('L3', 60)])
+
+    assert report['written'] == 2
+    assert [f['Id'] for f in report['failed']] == ['L2']
+    assert report['failed'][0]['errors'][0]['message'] == 'FIELD_INTEGRITY_EXCEPTION'
+
+
+def test_provisional_and_unscored_rows_are_not_written():
+    fake = FakeSalesforce()
+    report = make_writer(fake).write([
+        lead('L1', 90),
+        lead('L2', 65, score_provisional=True),
+        lead('L3', None),
+        {'priority_score': 10},
+    ])
+
+    assert [r['id'] for chunk in fake.patches for r in chunk] == ['L1']
+    assert report == {'checked': 4, 'unscored': 2, 'provisional': 1, 'unchanged': 0, 'written': 1, 'failed': []}
+
+
+@pytest.mark.parametrize('stored', [None, 12])
+def test_new_or_different_score_is_written(stored):
+    fake = FakeSalesforce(stored_scores={} if stored is None else {'L1': stored})
+    report = make_writer(fake).write([lead('L1', 88)])
+
+    assert report['written'] == 1
+
+
+def test_large_writes_use_the_bulk_api():
+    fake, bulk = FakeSalesforce(stored_scores={'L0': 70}), FakeBulkType(failing_ids={'L3'})
+    report = make_writer(fake, bulk=bulk, bulk_threshold=2).write([lead(f'L{i}', 70) for i in range(5)])
+
+    assert fake.patches == []
+    assert [row['Id'] for row in bulk.updates[0]] == ['L1', 'L2', 'L3', 'L4']
+    assert report['unchanged'] == 1
+    assert report['written'] == 3
+    assert report['failed'] == [{'Id': 'L3', 'success': False,
+                                 'errors': [{'message': 'FIELD_INTEGRITY_EXCEPTION',
+                                             'statusCode': 'FIELD_INTEGRITY_EXCEPTION'}]}]
+
+
+@pytest.mark.parametrize('bulk_threshold', [0, 5000])
+def test_failed_request_reports_the_same_error_shape(bulk_threshold):
+    class FailingSalesforce(FakeSalesforce):
+        def send(self, request, **kwargs):
+            if request.method == 'PATCH':
+                raise requests.ConnectionError('connection reset')
+            return super().send(request, **kwargs)
+
+    bulk = FakeBulkType(error=requests.ConnectionError('connection reset'))
+    report = make_writer(FailingSalesforce(), bulk=bulk, bulk_threshold=bulk_threshold).write(
+        [lead('L1', 90), lead('L2', 20)])
+
+    assert report['written'] == 0
+    assert [f['Id'] for f in report['failed']] == ['L1', 'L2']
+    assert all(f['errors'] == [{'message': 'connection reset'}] for f in report['failed'])
@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scoring_scheduler import DeadlineScheduler
+
+
+class FakeScorer:
+    """Returns 90 per record; 'slow' records wait until release() is called."""
+
+    def __init__(self):
+        self.calls = []
+        self.released = threading.Event()
+        self.failures = set()
+
+    def __call__(self, record):
+        self.calls.append(record['key'])
+        if record['key'] in self.failures:
+            raise RuntimeError('rate limited')
+        if record.get('slow'):
+            self.released.wait(5)
+        return 90
+
+    def release(self):
+        self.released.set()
+
+
+def records(*keys, slow=()):
+    return {key: {'key': key, 'slow': key in slow} for key in keys}
+
+
+def wait_for_idle(scheduler, timeout=5):
+    deadline = time.monotonic() + timeout
+    while any(not future.done() for future in list(scheduler._futures.values())):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_refresh_reuses_final_scores_without_recalling():
+    scorer = FakeScorer()
+    scheduler = DeadlineScheduler(scorer, lambda record: 50)
+    batch = records('fast', 'slow', slow={'slow'})
+
+    assert scheduler.scores(batch, budget=1) == {'fast': (90, False), 'slow': (50, True)}
+
+    scorer.release()
+    wait_for_idle(scheduler)
+    assert scheduler.scores(batch, budget=0.2) == {'fast': (90, False), 'slow': (90, False)}
+    assert scheduler.scores(batch, budget=0) == {'fast': (90, False), 'slow': (90, False)}
+    assert sorted(scorer.calls) == ['fast', 'slow']
+
+
+def test_cached_scores_do_not_take_workers_from_pending_ones():
+    scorer = FakeScorer()
+    scorer.release()
+    scheduler = DeadlineScheduler(scorer, lambda record: 50, max_workers=1)
+    scheduler.scores(records('a', 'b'), budget=None)
+
+    assert scheduler.scores(records('a', 'b', 'c'), budget=1) == {
+        'a': (90, False), 'b': (90, False), 'c': (90, False)}
+    assert sorted(scorer.calls) == ['a', 'b', 'c']
+
+
+def test_failed_calls_are_retried():
+    scorer = FakeScorer()
+    scorer.failures.add('a')
+    scheduler = DeadlineScheduler(scorer, lambda record: 50)
+
+    assert scheduler.scores(records('a'), budget=1) == {'a': (50, True)}
+    scorer.failures.clear()
+    assert scheduler.scores(records('a'), budget=1) == {'a': (90, False)}
+    assert scorer.calls == ['a', 'a']
+
+
+def test_clear_and_bound_forget_finished_scores():
+    scorer = FakeScorer()
+    scorer.release()
+    scheduler = DeadlineScheduler(scorer, lambda record: 50, max_results=2)
+
+    scheduler.scores(records('a', 'b', 'c'), budget=None)
+    scheduler.scores(records('b', 'c'), budget=None)
+    assert sorted(scorer.calls) == ['a', 'b', 'c']
+
+    scheduler.scores(records('a'), budget=None)
+    assert scorer.calls.count('a') == 2
+
+    scheduler.clear()
+    scheduler.scores(records('c'), budget=None)
+    assert scorer.calls.count('c') == 2
@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import httpx
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transport import (CassetteStore, CassetteMiss, RequestsCassetteAdapter, HTTPXCassetteTransport,
+                       RECORD, REPLAY)
+
+SESSION_ID = '00Dxx0000001gPL!AQ4AQFakeLiveSession'
+
+LOGIN_RESPONSE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body>
+<loginResponse><result><serverUrl>https://example.my.salesforce.com/services/Soap/u/59.0</serverUrl>
+<sessionId>{SESSION_ID}</sessionId></result></loginResponse></soapenv:Body></soapenv:Envelope>"""
+
+
+def login_body(password):
+    return (f"<env:Envelope><env:Body><n1:login><n1:username>user@example.com</n1:username>"
+            f"<n1:password>{password}</n1:password></n1:login></env:Body></env:Envelope>")
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.reply('application/json', json.dumps({'path': self.path}).encode('utf-8'))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if '/services/Soap/u/' in self.path:
+            self.reply('text/xml', LOGIN_RESPONSE.encode('utf-8'))
+        else:
+            self.reply('application/json', json.dumps({'echo': json.loads(body)}).encode('utf-8'))
+
+    def reply(self, content_type, body):
+        self.server.hits += 1
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    httpd.hits = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def requests_session(store, mode):
+    session = requests.Session()
+    session.mount('http://', RequestsCassetteAdapter(store, mode))
+    return session
+
+
+def stored_bodies(path):
+    with sqlite3.connect(path) as db:
+        return [zlib.decompress(body) for (body,) in db.execute("SELECT body FROM responses")]
+
+
+def test_requests_adapter_round_trip(server, tmp_path):
+    path = str(tmp_path / 'cassette.sqlite')
+    url = base_url(server) + '/services/data/v59.0/query?q=SELECT+Id+FROM+Lead'
+    recorded = requests_session(CassetteStore(path), RECORD).get(url)
+
+    replay = requests_session(CassetteStore(path, preload=True), REPLAY)
+    replayed = replay.get(url)
+    assert server.hits == 1
+    assert replayed.status_code == 200
+    assert replayed.json() == recorded.json()
+    with pytest.raises(CassetteMiss):
+        replay.get(base_url(server) + '/services/data/v59.0/query?q=SELECT+Id+FROM+Opportunity')
+
+
+def test_login_is_replayed_without_credentials(server, tmp_path):
+    path = str(tmp_path / 'cassette.sqlite')
+    url = base_url(server) + '/services/Soap/u/59.0'
+    recorded = requests_session(CassetteStore(path), RECORD).post(url, data=login_body('live-password'))
+    # The live client still gets the real session id
+    assert SESSION_ID in recorded.text
+
+    # Another machine with other credentials replays the same login
+    replayed = requests_session(CassetteStore(path, preload=True), REPLAY).post(url, data=login_body('other'))
+    assert server.hits == 1
+    assert SESSION_ID not in replayed.text
+    assert '<sessionId>REDACTED</sessionId>' in replayed.text
+    assert 'https://example.my.salesforce.com/services/Soap/u/59.0' in replayed.text
+    assert all(SESSION_ID.encode('utf-8') not in body for body in stored_bodies(path))
+
+
+def test_httpx_transport_round_trip(server, tmp_path):
+    path = str(tmp_path / 'cassette.sqlite')
+    url = base_url(server) + '/v1/chat/completions'
+    with httpx.Client(transport=HTTPXCassetteTransport(CassetteStore(path), RECORD)) as client:
+        recorded = client.post(url, json={'model': 'gpt-4', 'messages': [{'role': 'user', 'content': 'hi'}]})
+
+    with httpx.Client(transport=HTTPXCassetteTransport(CassetteStore(path, preload=True), REPLAY)) as client:
+        # JSON bodies are canonicalised, so key order does not matter
+        replayed = client.post(url, content=json.dumps(
+            {'messages': [{'content': 'hi', 'role': 'user'}], 'model': 'gpt-4'}))
+        assert server.hits == 1
+        assert replayed.status_code == 200
+        assert replayed.json() == recorded.json()
+        with pytest.raises(CassetteMiss):
+            client.post(url, json={'model': 'gpt-4', 'messages': []})
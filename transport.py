@@ -0,0 +1,218 @@
+"""Record/replay HTTP transport for the OpenAI client and simple-salesforce.
+
+Set SFDC_TRANSPORT to pick a mode:
+
+- passthrough (default): clients talk to the network as usual
+- record: every response is also saved to the cassette
+- replay: responses come from the cassette only; a miss raises CassetteMiss
+
+SFDC_CASSETTE is the cassette path (a single SQLite file). Requests are keyed
+on method, URL and body, so a replayed pipeline run is deterministic and
+never leaves the machine. Request bodies are not stored, only their hash.
+
+Login requests carry the username, password and security token, so they are
+keyed on method and URL alone and a cassette replays on any machine. The
+session ids and tokens they return are redacted before being stored.
+"""
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+import requests
+import threading
+import hashlib
+import sqlite3
+import re
+import httpx
+import json
+import zlib
+import os
+
+PASSTHROUGH = "passthrough"
+RECORD = "record"
+REPLAY = "replay"
+
+# Stored bodies are already decoded, so these would describe the wrong payload
+_DROP_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection'}
+
+# Login endpoints (SOAP and OAuth username-password flow); their bodies hold credentials
+_LOGIN_PATHS = ('/services/Soap/u/', '/services/oauth2/token')
+
+_SECRETS = [
+    (re.compile(rb'(<(?:\w+:)?sessionId>)[^<]*(</(?:\w+:)?sessionId>)'), rb'\1REDACTED\2'),
+    (re.compile(rb'("(?:access_token|refresh_token|id_token)"\s*:\s*")[^"]*(")'), rb'\1REDACTED\2'),
+]
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+def mode():
+    value = os.getenv("SFDC_TRANSPORT", PASSTHROUGH).lower()
+    if value not in (PASSTHROUGH, RECORD, REPLAY):
+        raise ValueError(f"SFDC_TRANSPORT must be passthrough, record or replay, not {value!r}")
+    return value
+
+
+def is_login(url):
+    return any(path in url for path in _LOGIN_PATHS)
+
+
+def scrub(url, body):
+    """`body` with session ids and tokens redacted if `url` is a login endpoint."""
+    if not is_login(url):
+        return body
+    for pattern, replacement in _SECRETS:
+        body = pattern.sub(replacement, body)
+    return body
+
+
+def request_key(method, url, body):
+    """Stable key for a request; JSON bodies are canonicalised first.
+
+    Login bodies are left out so credentials never reach the key.
+    """
+    body = b'' if is_login(url) else body or b''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(',', ':')).encode('utf-8')
+    except ValueError:
+        pass
+    digest = hashlib.sha256(f"{method.upper()} {url}\n".encode('utf-8'))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class CassetteStore:
+    """Responses keyed by request hash, zlib-compressed in one SQLite table.
+
+    In replay mode the whole cassette is loaded into a dict up front so
+    lookups never touch disk.
+    """
+
+    def __init__(self, path, preload=False):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB)"
+        )
+        self._memory = None
+        if preload:
+            rows = self._db.execute("SELECT key, status, headers, body FROM responses")
+            self._memory = {key: self._decode(status, headers, body) for key, status, headers, body in rows}
+
+    @staticmethod
+    def _decode(status, headers, body):
+        return status, json.loads(headers), zlib.decompress(body)
+
+    def __len__(self):
+        if self._memory is not None:
+            return len(self._memory)
+        return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """(status, headers, body) for `key`, or None."""
+        if self._memory is not None:
+            return self._memory.get(key)
+        with self._lock:
+            row = self._db.execute("SELECT status, headers, body FROM responses WHERE key = ?", (key,)).fetchone()
+        return self._decode(*row) if row else None
+
+    def put(self, key, status, headers, body):
+        headers = {k: v for k, v in headers.items() if k.lower() not in _DROP_HEADERS}
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, status, json.dumps(headers), zlib.compress(body)),
+            )
+            self._db.commit()
+        if self._memory is not None:
+            self._memory[key] = (status, headers, body)
+
+
+@lru_cache(maxsize=None)
+def get_store(path=None, preload=None):
+    path = path or os.getenv("SFDC_CASSETTE", "cassettes/default.sqlite")
+    return CassetteStore(path, preload=mode() == REPLAY if preload is None else preload)
+
+
+class RequestsCassetteAdapter(HTTPAdapter):
+    """requests adapter used by simple-salesforce."""
+
+    def __init__(self, store, mode):
+        super().__init__()
+        self.store = store
+        self.mode = mode
+
+    def send(self, request, **kwargs):
+        key = request_key(request.method, request.url, request.body)
+        if self.mode == REPLAY:
+            hit = self.store.get(key)
+            if hit is None:
+                raise CassetteMiss(f"No recorded response for {request.method} {request.url}")
+            status, headers, body = hit
+            response = requests.Response()
+            response.status_code = status
+            response.headers.update(headers)
+            response._content = body
+            response.url = request.url
+            response.request = request
+            response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+            return response
+
+        response = super().send(request, **kwargs)
+        if self.mode == RECORD:
+            self.store.put(key, response.status_code, dict(response.headers), scrub(request.url, response.content))
+        return response
+
+
+class HTTPXCassetteTransport(httpx.BaseTransport):
+    """httpx transport used by the OpenAI client (and ChatOpenAI)."""
+
+    def __init__(self, store, mode):
+        self.store = store
+        self.mode = mode
+        self._inner = httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        key = request_key(request.method, str(request.url), request.read())
+        if self.mode == REPLAY:
+            hit = self.store.get(key)
+            if hit is None:
+                raise CassetteMiss(f"No recorded response for {request.method} {request.url}")
+            status, headers, body = hit
+            return httpx.Response(status, headers=headers, content=body, request=request)
+
+        response = self._inner.handle_request(request)
+        body = response.read()
+        response.close()
+        if self.mode == RECORD:
+            self.store.put(key, response.status_code, dict(response.headers), scrub(str(request.url), body))
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _DROP_HEADERS}
+        return httpx.Response(response.status_code, headers=headers, content=body, request=request)
+
+    def close(self):
+        self._inner.close()
+
+
+def openai_http_client():
+    """httpx client for OpenAI(http_client=...); None in passthrough mode."""
+    current = mode()
+    if current == PASSTHROUGH:
+        return None
+    return httpx.Client(transport=HTTPXCassetteTransport(get_store(), current), timeout=600)
+
+
+def salesforce_session():
+    """requests session for Salesforce(session=...); None in passthrough mode."""
+    current = mode()
+    if current == PASSTHROUGH:
+        return None
+    session = requests.Session()
+    adapter = RequestsCassetteAdapter(get_store(), current)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session